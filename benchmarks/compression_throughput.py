@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+"""
+compression_throughput.py :
+
+Compares the write and read throughput and the file size of uncompressed and
+tile compressed clean images, to choose between spending CPU on compression
+or I/O bandwidth on larger files. Run it from a folder on the disk that
+the clean images will be written to.
+
+Usage: python benchmarks/compression_throughput.py [--n-runs N]
+"""
+import argparse
+import os
+import tempfile
+import time
+import numpy as np
+from fringez.utils import create_fits, load_fits, COMPRESSION_TYPES
+
+
+def return_test_image(image_shape, seed=0):
+    """Returns a float32 image of sky background with noise and a smooth
+    fringe-like pattern, similar to a clean ZTF i-band image."""
+
+    rng = np.random.RandomState(seed)
+    y, x = np.indices(image_shape)
+    fringes = 5 * np.sin(x / 40.) * np.cos(y / 55.)
+    image = 150 + fringes + rng.normal(0, 10, image_shape)
+
+    return image.astype(np.float32)
+
+
+def time_format(image, image_name, compression_type, quantize_level, n_runs):
+    """Returns the median write and read times in seconds, the file size in
+    bytes and the maximum error of the image read back from disk."""
+
+    write_times, read_times = [], []
+    for _ in range(n_runs):
+        t0 = time.perf_counter()
+        create_fits(image_name, image,
+                    compression_type=compression_type,
+                    quantize_level=quantize_level)
+        write_times.append(time.perf_counter() - t0)
+
+        t0 = time.perf_counter()
+        data, _ = load_fits(image_name)
+        data = np.array(data)
+        read_times.append(time.perf_counter() - t0)
+
+    size = os.path.getsize(image_name)
+    max_error = float(np.max(np.abs(data - image)))
+    os.remove(image_name)
+
+    return np.median(write_times), np.median(read_times), size, max_error
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--image-shape', type=int, nargs=2,
+                        default=[3080, 3072],
+                        help='Shape of the test image as rows and columns.')
+    parser.add_argument('--n-runs', type=int, default=3,
+                        help='Number of writes and reads of each format.')
+    parser.add_argument('--quantize-levels', type=float, nargs='+',
+                        default=[4., 16., 64.],
+                        help='Quantization levels tested for each lossy '
+                             'compression type.')
+    parser.add_argument('--folder', type=str, default='.',
+                        help='Folder that test images are written to.')
+    args = parser.parse_args()
+
+    image = return_test_image(tuple(args.image_shape))
+    image_mb = image.nbytes / 1024. ** 2
+
+    formats = [(None, None)]
+    for compression_type in COMPRESSION_TYPES:
+        for quantize_level in args.quantize_levels:
+            formats.append((compression_type, quantize_level))
+        if compression_type.startswith('GZIP'):
+            formats.append((compression_type, 0.))
+
+    print('%-12s %8s %10s %10s %8s %10s' % ('compression', 'quantize',
+                                           'write MB/s', 'read MB/s',
+                                           'ratio', 'max error'))
+    with tempfile.TemporaryDirectory(dir=args.folder) as folder:
+        image_name = os.path.join(folder, 'benchmark.fits')
+        for compression_type, quantize_level in formats:
+            write_time, read_time, size, max_error = time_format(
+                image, image_name, compression_type, quantize_level,
+                args.n_runs)
+            print('%-12s %8s %10.1f %10.1f %8.2f %10.4f' % (
+                compression_type or 'none',
+                '-' if quantize_level is None else '%g' % quantize_level,
+                image_mb / write_time,
+                image_mb / read_time,
+                image.nbytes / float(size),
+                max_error))
+
+
+if __name__ == '__main__':
+    main()
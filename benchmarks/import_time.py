@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+"""
+import_time.py :
+
+Measures how long each fringez executable takes to import the modules on its
+code path and checks that no unneeded optional dependency is imported at
+startup. Exits with a non-zero status if a check fails, so it can be used to
+guard against import regressions.
+
+Usage: python benchmarks/import_time.py [--n-runs N] [--max-seconds S]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+here = os.path.abspath(os.path.dirname(__file__))
+bin_dir = os.path.join(os.path.dirname(here), 'bin')
+
+# Modules that must not be imported when each executable starts up
+FORBIDDEN_MODULES = {
+    'fringez-clean': ['requests', 'wget', 'bs4', 'sklearn', 'matplotlib',
+                      'photutils', 'cProfile'],
+    'fringez-generate': ['requests', 'wget', 'bs4', 'sklearn', 'matplotlib',
+                         'photutils', 'cProfile'],
+    'fringez-download': ['sklearn', 'matplotlib', 'photutils',
+                         'requests', 'wget', 'bs4', 'cProfile'],
+    'fringez-qa': ['requests', 'wget', 'bs4', 'sklearn', 'photutils',
+                   'cProfile', 'joblib'],
+    'fringez-serve': ['requests', 'wget', 'bs4', 'sklearn', 'matplotlib',
+                      'photutils', 'cProfile'],
+}
+
+# Executed in a fresh interpreter so that every measurement is a cold import.
+# The executable is run as a module without calling main(), which imports
+# exactly what the executable imports at startup.
+PROBE = """
+import json, runpy, sys, time
+t0 = time.perf_counter()
+runpy.run_path(sys.argv[1], run_name='fringez_import_probe')
+duration = time.perf_counter() - t0
+print(json.dumps({'seconds': duration, 'modules': sorted(sys.modules)}))
+"""
+
+
+def probe_executable(executable):
+    """Imports an executable in a fresh interpreter and returns the import
+    time and the list of imported modules."""
+
+    output = subprocess.check_output([sys.executable, '-c', PROBE,
+                                      os.path.join(bin_dir, executable)])
+    return json.loads(output.decode().strip().split('\n')[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--n-runs', type=int, default=5,
+                        help='Number of cold imports per executable.')
+    parser.add_argument('--max-seconds', type=float, default=None,
+                        help='Fail if the median import time of any '
+                             'executable exceeds this many seconds.')
+    args = parser.parse_args()
+
+    failed = False
+    for executable, forbidden in sorted(FORBIDDEN_MODULES.items()):
+        durations = []
+        for _ in range(args.n_runs):
+            result = probe_executable(executable)
+            durations.append(result['seconds'])
+        median = statistics.median(durations)
+        print('%s : median import %.3fs over %i runs (%i modules)' % (
+            executable, median, args.n_runs, len(result['modules'])))
+
+        modules = set(result['modules'])
+        for module in forbidden:
+            if module in modules:
+                print('-- FAIL : %s imports %s at startup' % (executable,
+                                                              module))
+                failed = True
+
+        if args.max_seconds is not None and median > args.max_seconds:
+            print('-- FAIL : %s imports in %.3fs > %.3fs' % (executable,
+                                                            median,
+                                                            args.max_seconds))
+            failed = True
+
+    if failed:
+        sys.exit(1)
+    print('All import checks passed')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,13 +1,15 @@
 #!/usr/bin/env python
 """fringe.py"""
-from astropy.io import fits
 import numpy as np
 import sys
 import os
 import glob
-from fringez.utils import create_fits, flatten_images
+from fringez.utils import (create_fits, flatten_images, load_fits,
+                           load_fits_header, return_fits_name)
+from fringez.instrument import timer, timed, increment
 
 
+@timed
 def generate_fringe_map(image, mask_image=None):
     """
     Create a fringe map from a science image.
@@ -45,6 +47,7 @@ def gather_flat_fringe_maps(N_samples, parallelFlag):
     return fname_arr, fringe_maps_flattened, image_shape, rcid
 
 
+@timed
 def gather_fringe_maps(N_samples, parallelFlag):
     if parallelFlag:
         from mpi4py import MPI
@@ -57,11 +60,13 @@ def gather_fringe_maps(N_samples, parallelFlag):
     if rank == 0:
         # Only select images currently on disk
         fringe_filename_arr = glob.glob('ztf*sciimg*fits')
+        fringe_filename_arr += glob.glob('ztf*sciimg*fits.fz')
         fringe_filename_arr.sort()
         maglimit_arr = []
-        for fringe_filename in fringe_filename_arr:
-            with fits.open(fringe_filename) as f:
-                maglimit_arr.append(f[0].header['MAGLIM'])
+        with timer('fringe.read_headers'):
+            for fringe_filename in fringe_filename_arr:
+                header = load_fits_header(fringe_filename)
+                maglimit_arr.append(header['MAGLIM'])
         fringe_filename_arr = np.array(fringe_filename_arr)
         maglimit_arr = np.array(maglimit_arr)
         N_images = len(fringe_filename_arr)
@@ -77,8 +82,8 @@ def gather_fringe_maps(N_samples, parallelFlag):
         print('rcid = %i' % rcid)
 
         # Determine the image_shape
-        with fits.open(fringe_filename_arr[0]) as f:
-            image_shape = f[0].data.shape
+        header = load_fits_header(fringe_filename_arr[0])
+        image_shape = (header['NAXIS2'], header['NAXIS1'])
 
         # Calculate the size of the samples
         if N_samples is None:
@@ -111,8 +116,7 @@ def gather_fringe_maps(N_samples, parallelFlag):
 
         for i, idx in enumerate(my_idx_sample):
             fringe_filename = fringe_filename_arr[idx]
-            with fits.open(fringe_filename) as f:
-                data_fringe = f[0].data
+            data_fringe, _ = load_fits(fringe_filename)
             if data_fringe.shape != image_shape:
                 print('%s != %s' % (str(fringe_map.shape), str(image_shape)))
                 print('** ALL FRINGE MAPS MUST BE THE SAME SIZE **')
@@ -121,13 +125,13 @@ def gather_fringe_maps(N_samples, parallelFlag):
 
             mskimg_filepath = fringe_filename.replace('sciimg', 'mskimg')
             if os.path.exists(mskimg_filepath):
-                with fits.open(mskimg_filepath) as f:
-                    data_mskimg = f[0].data
+                data_mskimg, _ = load_fits(mskimg_filepath)
             else:
                 data_mskimg = None
 
             fringe_map, _ = generate_fringe_map(data_fringe, mask_image=data_mskimg)
             my_sample[i] = fringe_map
+            increment('fringe_maps_generated')
             del data_fringe, fringe_map
 
         if parallelFlag:
@@ -143,7 +147,8 @@ def gather_fringe_maps(N_samples, parallelFlag):
             sample = my_sample
 
         if rank == 0:
-            sample_median = np.median(sample, axis=0)
+            with timer('fringe.sample_median'):
+                sample_median = np.median(sample, axis=0)
             fringe_maps.append(sample_median)
 
     return fringe_filename_arr, fringe_maps, rcid
@@ -156,6 +161,7 @@ def append_eigenvalues_to_header(header, fringe_ica):
     return header
 
 
+@timed
 def calculate_fringe_bias(fringe_map, median_absdev, fringe_model):
     """ Generates fringe bias image for the provided science image.
     These formulas are taken from the scikit-learn estimator's
@@ -182,56 +188,90 @@ def calculate_fringe_bias(fringe_map, median_absdev, fringe_model):
     return fringe_bias, fringe_proj
 
 
+@timed
 def remove_fringe_and_save(image_name,
                   fringe_model_name,
                   debugFlag=False,
-                  mask=None):
+                  mask=None,
+                  fringe_model=None,
+                  compression_type=None,
+                  quantize_level=16.):
     """ Subtracts the fringe bias image from the science image, resulting in
-    a clean image with extension *sciimg.clean.fits.
+    a clean image with extension *sciimg.clean.fits. Science images can be
+    uncompressed or tile compressed. If compression_type is set, the clean
+    image is tile compressed with quantize_level (see utils.create_fits)
+    and saved with extension *sciimg.clean.fits.fz.
 
     Models are loaded from disk as
-    fringe_{MODEL_NAME}_comp{N_COMPONENTS}.c{CID}_q{QID}.{DATE}.model """
+    fringe_{MODEL_NAME}_comp{N_COMPONENTS}.c{CID}_q{QID}.{DATE}.model
+    unless an already loaded fringe_model is provided.
+
+    Returns the filename of the clean image. """
 
     if not os.path.exists(image_name):
         print('Image missing! Exiting...')
         sys.exit(0)
 
-    if not os.path.exists(fringe_model_name):
+    if fringe_model is None and not os.path.exists(fringe_model_name):
         print('Fringe model missing! Exiting...')
         sys.exit(0)
 
     print('Generating clean image for %s' % image_name)
 
-    with fits.open(image_name) as f:
-        image = f[0].data
-        header = f[0].header
+    image, header = load_fits(image_name)
 
     image_clean, fringe_bias, fringe_proj = remove_fringe(image, fringe_model_name, 
-                                                          mask=mask)
+                                                          mask=mask,
+                                                          fringe_model=fringe_model)
 
     header = append_eigenvalues_to_header(header, fringe_proj)
     header['FRNGMDL'] = os.path.basename(fringe_model_name)
 
-    image_clean_fname = image_name.replace('.fits', '.clean.fits')
-    create_fits(image_clean_fname, image_clean, header)
+    image_clean_fname = return_fits_name(image_name, 'clean',
+                                         compression_type=compression_type)
+    create_fits(image_clean_fname, image_clean, header,
+                compression_type=compression_type,
+                quantize_level=quantize_level)
     print('-- %s saved to disk' % image_clean_fname)
 
     if debugFlag:
         extension = os.path.basename(fringe_model_name).replace('.model',
                                                                 '.bias')
-        fname = image_name.replace('.fits', '.%s.fits' % extension)
-        create_fits(fname, fringe_bias, header)
+        fname = return_fits_name(image_name, extension,
+                                 compression_type=compression_type)
+        create_fits(fname, fringe_bias, header,
+                    compression_type=compression_type,
+                    quantize_level=quantize_level)
 
         print('-- %s saved to disk' % fname)
 
-def remove_fringe(image, fringe_model_name, mask=None):
+    increment('images_cleaned')
+
+    return image_clean_fname
+
+
+@timed
+def load_fringe_model(fringe_model_name):
+    """Loads a fringe model from disk into memory as a dictionary of arrays."""
+
+    with np.load(fringe_model_name) as f:
+        fringe_model = {key: f[key] for key in f.files}
+
+    return fringe_model
+
+
+@timed
+def remove_fringe(image, fringe_model_name, mask=None, fringe_model=None):
     """
     Mid-Level function of fringe removal.
+    If fringe_model is provided, it is used instead of loading
+    fringe_model_name from disk.
     """
 
     fringe_map, median_absdev = generate_fringe_map(image, mask_image=mask)
 
-    fringe_model = np.load(fringe_model_name)
+    if fringe_model is None:
+        fringe_model = load_fringe_model(fringe_model_name)
 
     fringe_bias, fringe_proj = calculate_fringe_bias(fringe_map, median_absdev, fringe_model)
     fringe_bias = fringe_bias.reshape(image.shape)
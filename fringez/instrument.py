@@ -0,0 +1,200 @@
+#!/usr/bin/env python
+"""instrument.py"""
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+_state = {'enabled': False,
+          'metrics_out': None,
+          'profiler': None,
+          'cprofile_out': None}
+_timers = {}
+_counters = {}
+# Guards the summaries and the metrics output when fringez is used from
+# multiple threads, such as by the workers of fringez.service.FringeCleaner
+_lock = threading.Lock()
+
+
+def return_peak_memory_mb():
+    """Returns the peak resident memory of the process in MB, or None if
+    the platform cannot report it."""
+
+    if resource is None:
+        return None
+
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in bytes on macOS and in kilobytes elsewhere
+    if sys.platform == 'darwin':
+        return maxrss / 1024. ** 2
+    return maxrss / 1024.
+
+
+def enable_instrumentation(metrics_out=None, cprofile_out=None):
+    """Turns on the timers and counters in fringez.
+
+    Records are written as JSON lines to metrics_out, or to stderr if
+    metrics_out is None. If cprofile_out is set, a cProfile of the calling
+    thread is dumped to that filename by disable_instrumentation. Timers and
+    counters cover every thread, but the cProfile does not.
+    """
+
+    _timers.clear()
+    _counters.clear()
+    _state['enabled'] = True
+    _state['metrics_out'] = metrics_out
+    _state['cprofile_out'] = cprofile_out
+
+    if cprofile_out is not None:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+        _state['profiler'] = profiler
+
+
+def disable_instrumentation():
+    """Writes a summary of all timers and counters, dumps the cProfile
+    if one is running and turns off instrumentation."""
+
+    if not _state['enabled']:
+        return
+
+    profiler = _state['profiler']
+    if profiler is not None:
+        profiler.disable()
+        profiler.dump_stats(_state['cprofile_out'])
+        _state['profiler'] = None
+
+    with _lock:
+        timers = {name: dict(summary) for name, summary in _timers.items()}
+        counters = dict(_counters)
+    emit({'event': 'summary',
+          'timers': timers,
+          'counters': counters})
+
+    _state['enabled'] = False
+
+
+def is_enabled():
+    return _state['enabled']
+
+
+def emit(record):
+    """Writes a single JSON line record to the metrics output."""
+
+    if not _state['enabled']:
+        return
+
+    record = dict(record)
+    record['pid'] = os.getpid()
+    record['time'] = time.time()
+    record['peak_rss_mb'] = return_peak_memory_mb()
+    line = json.dumps(record) + '\n'
+
+    with _lock:
+        if _state['metrics_out'] is None:
+            sys.stderr.write(line)
+            sys.stderr.flush()
+        else:
+            # Appending one line at a time allows multiple MPI ranks
+            # to share a single metrics file
+            with open(_state['metrics_out'], 'a') as f:
+                f.write(line)
+
+
+def increment(name, value=1):
+    """Increments the counter called name."""
+
+    if not _state['enabled']:
+        return
+
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+@contextmanager
+def timer(name):
+    """Times the enclosed block, emitting a record for the stage
+    and adding the duration to the summary for name."""
+
+    if not _state['enabled']:
+        yield
+        return
+
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration = time.perf_counter() - t0
+        with _lock:
+            summary = _timers.setdefault(name, {'count': 0,
+                                                'total_seconds': 0.})
+            summary['count'] += 1
+            summary['total_seconds'] += duration
+        emit({'event': 'timer',
+              'name': name,
+              'seconds': duration})
+
+
+def timed(func):
+    """Decorator that times every call to func under the name
+    {MODULE}.{FUNCTION}."""
+
+    name = '%s.%s' % (func.__module__.replace('fringez.', ''),
+                      func.__name__)
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        if not _state['enabled']:
+            return func(*args, **kwargs)
+        with timer(name):
+            return func(*args, **kwargs)
+
+    return wrapper
+
+
+def add_instrumentation_arguments(parser):
+    """Adds the --profile, --metrics-out and --cprofile-out arguments
+    to an executable's argument parser."""
+
+    instrumentation = parser.add_argument_group('instrumentation')
+    instrumentation.add_argument('--profile', dest='profileFlag',
+                                 action='store_true',
+                                 help='Record per-stage timings, counters '
+                                      'and peak memory as JSON lines. '
+                                      'Records are written to stderr unless '
+                                      '--metrics-out is set.')
+    instrumentation.add_argument('--metrics-out', type=str, default=None,
+                                 help='Append instrumentation JSON lines to '
+                                      'this file. Implies --profile.')
+    instrumentation.add_argument('--cprofile-out', type=str, default=None,
+                                 help='Dump a cProfile of the run to this '
+                                      'file. In --parallel mode the rank '
+                                      'is appended to the filename. '
+                                      'Implies --profile.')
+    parser.set_defaults(profileFlag=False)
+
+
+def start_instrumentation(args, rank=0):
+    """Enables instrumentation if requested by the executable's arguments.
+    Returns True if instrumentation was enabled."""
+
+    if not (args.profileFlag or args.metrics_out or args.cprofile_out):
+        return False
+
+    cprofile_out = args.cprofile_out
+    if cprofile_out is not None and getattr(args, 'parallelFlag', False):
+        cprofile_out = '%s.%i' % (cprofile_out, rank)
+
+    enable_instrumentation(metrics_out=args.metrics_out,
+                           cprofile_out=cprofile_out)
+    return True
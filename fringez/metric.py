@@ -3,20 +3,22 @@
 metric.py
 """
 
-from astropy.io import fits
 from photutils import (MedianBackground, StdBackgroundRMS,
                         aperture_photometry, CircularAperture)
 from photutils.background import Background2D
 import numpy as np
 import os
-from fringez.utils import create_fits, update_fits
+from fringez.utils import (create_fits, update_fits, load_fits,
+                           remove_fz_extension)
+from fringez.instrument import timer, timed, increment
 
 
+@timed
 def return_backgrounds(image, mask, mskimg_fname, saveBackground=True):
-    rms_fname = mskimg_fname.replace('mskimg', 'rmsimg')
+    # The background is saved uncompressed, even for compressed masks
+    rms_fname = remove_fz_extension(mskimg_fname).replace('mskimg', 'rmsimg')
     if os.path.exists(rms_fname):
-        with fits.open(rms_fname) as f:
-            rms = f[0].data
+        rms, _ = load_fits(rms_fname)
     else:
         bkg = Background2D(image, (10, 10), mask=mask, filter_size=1,
                            bkg_estimator=MedianBackground(sigma_clip=None),
@@ -28,15 +30,13 @@ def return_backgrounds(image, mask, mskimg_fname, saveBackground=True):
 
   
 def load_image_and_mask(sciimg_fname, mskimg_fname):
-    with fits.open(sciimg_fname) as f:
-        image = f[0].data
-        image_header = f[0].header
+    image, image_header = load_fits(sciimg_fname)
 
-    with fits.open(mskimg_fname) as f:
-        mask = f[0].data
+    mask, _ = load_fits(mskimg_fname)
     mask = mask.astype(bool)
 
 
+@timed
 def return_aperture_locations(mask, N_apertures=50000, aperture_size=2,
                               edge_buffer=10, aperture_buffer_multiple=3):
     aperture_locations = []
@@ -58,6 +58,7 @@ def return_aperture_locations(mask, N_apertures=50000, aperture_size=2,
     return aperture_locations
 
 
+@timed
 def calculate_UBI(sciimg_fname, mskimg_fname=None,
                   N_apertures=20000, N_samples=3, aperture_size=2,
                   updateHeader=True):
@@ -72,17 +73,19 @@ def calculate_UBI(sciimg_fname, mskimg_fname=None,
                                                        N_apertures=N_apertures,
                                                        aperture_size=aperture_size)
         aperture = CircularAperture(aperture_locations, r=aperture_size)
-        phot_table = aperture_photometry(image, aperture,
-                                         error=bkg_rms, mask=mask)
+        with timer('metric.aperture_photometry'):
+            phot_table = aperture_photometry(image, aperture,
+                                             error=bkg_rms, mask=mask)
         flux = phot_table['aperture_sum']
         fluxerr = phot_table['aperture_sum_err']
         fluxerr_pixel = fluxerr / aperture.area
         UBI = (np.std(flux) + np.median(fluxerr_pixel)) / np.median(fluxerr)
         UBI_arr.append(UBI)
+        increment('apertures_measured', len(aperture_locations))
 
     if updateHeader:
         image_header[f'UBI{aperture_size:0.0f}'] = np.median(UBI_arr)
         image_header[f'UBIERR{aperture_size:0.0f}'] = np.std(UBI_arr)
-        update_fits(sciimg_fname, image, image_header)
+        update_fits(sciimg_fname, header=image_header)
 
     return np.median(UBI_arr), np.std(UBI_arr)
@@ -1,17 +1,17 @@
 #!/usr/bin/env python
 """model.py"""
 import numpy as np
-from sklearn import decomposition
 from time import time
 from datetime import datetime
 import shutil
-from fringez.plot import plot_gallery
+from fringez.instrument import timer, timed
 
 
 def return_estimators(n_components):
     """Returns all of the estimators that can be used to generate models.
     A larger selection of possible estimators have been commented out, but
     could be uncommented."""
+    from sklearn import decomposition
 
     estimators = [
         ('PCArandom',
@@ -50,6 +50,7 @@ def return_estimator_names():
     return estimator_names
 
 
+@timed
 def generate_models(fname_arr,
                     fringe_maps_flattened,
                     image_shape,
@@ -93,15 +94,17 @@ def generate_models(fname_arr,
                           name))
 
         t0 = time()
-        estimator.fit(fringe_maps_flattened)  # subtracts mean and whitens
+        with timer('model.fit.%s' % name):
+            estimator.fit(fringe_maps_flattened)  # subtracts mean and whitens
         train_time = (time() - t0)
         print("Fitting Model: done in %0.3fs" % train_time)
 
-        np.savez(model_name,
-                 mean=estimator.mean_,
-                 components=estimator.components_,
-                 explained_variance=estimator.explained_variance_)
-        shutil.move(model_name + '.npz', model_name + '.model')
+        with timer('model.save'):
+            np.savez(model_name,
+                     mean=estimator.mean_,
+                     components=estimator.components_,
+                     explained_variance=estimator.explained_variance_)
+            shutil.move(model_name + '.npz', model_name + '.model')
         print('Fringe Model saved as: %s.model' % model_name)
 
         log_name = model_name + '.model_list'
@@ -111,6 +114,7 @@ def generate_models(fname_arr,
         print('Log saved as: %s' % log_name)
 
         if plotFlag:
+            from fringez.plot import plot_gallery
             title = '%s components' % model_name
             plot_gallery(title,
                          estimator.components_[:n_components],
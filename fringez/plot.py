@@ -1,23 +1,53 @@
 #!/usr/bin/env python
 """plot.py"""
-import matplotlib.pyplot as plt
 import matplotlib
 matplotlib.use('agg')
+import matplotlib.pyplot as plt
+import matplotlib.image
 import numpy as np
+import os
+from fringez.utils import load_fits, remove_fz_extension
+
+
+def decimate_image(image, max_size=512):
+    """Shrinks an image by averaging blocks of pixels until neither side
+    is larger than max_size. Fringes span many pixels and survive
+    the averaging."""
+
+    factor = int(np.ceil(max(image.shape) / float(max_size)))
+    if factor <= 1:
+        return image
+
+    ny = image.shape[0] // factor * factor
+    nx = image.shape[1] // factor * factor
+    blocks = image[:ny, :nx].reshape(ny // factor, factor,
+                                     nx // factor, factor)
+
+    return blocks.mean(axis=(1, 3))
+
 
+def return_histogram_sample(image, n_samples=20000):
+    """Returns an evenly spaced subsample of the pixels in an image
+    for calculating histograms."""
 
-def plot_gallery(title, images, image_shape):
+    pixels = image.ravel()
+    step = max(1, len(pixels) // n_samples)
+
+    return pixels[::step]
+
+
+def plot_gallery(title, images, image_shape, max_size=512):
     """Plots a panel of images"""
 
     n_images, _ = images.shape
     n_col = n_row = np.ceil(np.sqrt(n_images)).astype(int)
 
-    fig, ax = plt.subplots(n_row, n_col)
+    fig, ax = plt.subplots(n_row, n_col, squeeze=False)
     ax = ax.flatten()
     fig.suptitle(title, size=10)
     for i, comp in enumerate(images):
         vmax = max(comp.max(), -comp.min())
-        ax[i].imshow(comp.reshape(image_shape),
+        ax[i].imshow(decimate_image(comp.reshape(image_shape), max_size),
                      cmap='gray',
                      interpolation='None',
                      vmin=-vmax, vmax=vmax,
@@ -32,7 +62,8 @@ def plot_gallery(title, images, image_shape):
     plt.close()
 
 
-def plot_before_and_after(title, fringe_map, fringe_bias):
+def plot_before_and_after(title, fringe_map, fringe_bias,
+                          max_size=512, n_samples=20000):
     """Plots the difference between a fringe map the estimators fringe bias."""
 
     vmax = max(fringe_map.max(), -fringe_map.min())
@@ -42,34 +73,36 @@ def plot_before_and_after(title, fringe_map, fringe_bias):
     ax = ax.flatten()
 
     fig.suptitle(title, size=10)
-    ax[0].imshow(fringe_map,
+    ax[0].imshow(decimate_image(fringe_map, max_size),
                  cmap='gray',
                  interpolation='None',
                  vmin=-vmax, vmax=vmax,
                  origin='lower')
     ax[0].set_title('Fringe Map')
 
-    ax[1].imshow(fringe_bias,
+    ax[1].imshow(decimate_image(fringe_bias, max_size),
                  cmap='gray',
                  interpolation='None',
                  vmin=-vmax, vmax=vmax,
                  origin='lower')
     ax[1].set_title('Fringe Bias')
 
-    ax[2].imshow(residual,
+    ax[2].imshow(decimate_image(residual, max_size),
                  cmap='gray',
                  interpolation='None',
                  vmin=-vmax, vmax=vmax,
                  origin='lower')
     ax[2].set_title('Residual')
 
-    std_image = float(np.std(fringe_map))
-    std_residual = float(np.std(residual))
+    fringe_map_sample = return_histogram_sample(fringe_map, n_samples)
+    residual_sample = return_histogram_sample(residual, n_samples)
+    std_image = float(np.std(fringe_map_sample))
+    std_residual = float(np.std(residual_sample))
     bins = np.linspace(-std_image, std_image, 200)
-    ax[3].hist(fringe_map.flatten(), bins=bins,
+    ax[3].hist(fringe_map_sample, bins=bins,
                color='g', alpha=0.3,
                label='Original +- %.2f' % std_image)
-    ax[3].hist(residual.flatten(), bins=bins,
+    ax[3].hist(residual_sample, bins=bins,
                color='b', alpha=0.3,
                label='Residual +- %.2f' % std_residual)
     ax[3].set_title('Pixel Histogram')
@@ -79,3 +112,98 @@ def plot_before_and_after(title, fringe_map, fringe_bias):
     fig.savefig(fname)
     print('%s saved to disk' % fname)
     plt.close()
+
+
+def save_thumbnail(fname, panels, vmax, n_col=None, gap=4):
+    """Tiles equally sized panels into a grid, n_col panels wide, and writes
+    them to disk as a grayscale PNG scaled between -vmax and vmax. This skips
+    building a matplotlib figure entirely."""
+
+    n_panels = len(panels)
+    if n_col is None:
+        n_col = n_panels
+    n_row = int(np.ceil(n_panels / float(n_col)))
+    ny, nx = panels[0].shape
+
+    # Gaps between the panels are drawn at -vmax (black)
+    thumbnail = np.full((n_row * (ny + gap) - gap, n_col * (nx + gap) - gap),
+                        -vmax, dtype=np.float32)
+    for i, panel in enumerate(panels):
+        row, col = divmod(i, n_col)
+        # Row zero is drawn at the top of the image
+        y0 = (n_row - 1 - row) * (ny + gap)
+        x0 = col * (nx + gap)
+        thumbnail[y0:y0 + ny, x0:x0 + nx] = panel
+
+    matplotlib.image.imsave(fname, thumbnail,
+                            cmap='gray',
+                            vmin=-vmax, vmax=vmax,
+                            origin='lower')
+
+    return fname
+
+
+def render_before_and_after_thumbnail(image_clean_name, max_size=512,
+                                      n_samples=20000, n_sigma=3):
+    """Renders a thumbnail of a science image, its clean image and the fringe
+    bias that was subtracted between them, from left to right. All three
+    panels share a scale of +-n_sigma of the science image background,
+    estimated from a subsample of its pixels.
+
+    Returns the filename of the thumbnail, which is saved to disk as
+    *sciimg.clean.qa.png. The clean image and the science image can each
+    be either uncompressed (*.fits) or tile compressed (*.fits.fz). """
+
+    image_clean_base = remove_fz_extension(image_clean_name)
+    image_name = image_clean_base.replace('.clean.fits', '.fits')
+    if not os.path.exists(image_name):
+        image_name += '.fz'
+    image, _ = load_fits(image_name)
+    image = decimate_image(image.astype(np.float32), max_size)
+    image_clean, _ = load_fits(image_clean_name)
+    image_clean = decimate_image(image_clean.astype(np.float32), max_size)
+
+    sample = return_histogram_sample(image, n_samples)
+    median = np.median(sample)
+    median_absdev = np.median(np.abs(sample - median))
+    vmax = median_absdev * 1.48 * n_sigma
+    if vmax == 0:
+        vmax = 1.
+
+    panels = [image - median,
+              image_clean - median,
+              image - image_clean]
+    fname = image_clean_base.replace('.fits', '.qa.png')
+
+    return save_thumbnail(fname, panels, vmax)
+
+
+def render_components_thumbnail(fringe_model_name, image_shape,
+                                max_size=256):
+    """Renders a thumbnail of every component of a fringe model, tiled into a
+    square grid. Returns the filename of the thumbnail, which is saved to
+    disk as {FRINGE_MODEL_NAME}.qa.png """
+
+    with np.load(fringe_model_name) as f:
+        components = f['components']
+    if components.shape[1] != image_shape[0] * image_shape[1]:
+        raise ValueError('%s components do not have shape %s' %
+                         (fringe_model_name, str(tuple(image_shape))))
+
+    panels = [decimate_image(comp.reshape(image_shape), max_size)
+              for comp in components]
+    vmax = max(float(np.abs(panel).max()) for panel in panels)
+    n_col = int(np.ceil(np.sqrt(len(panels))))
+    fname = fringe_model_name + '.qa.png'
+
+    return save_thumbnail(fname, panels, vmax, n_col=n_col)
+
+
+def render_thumbnails(render_function, names, n_jobs=-1, **kwargs):
+    """Calls render_function on every name in parallel across n_jobs
+    processes. n_jobs=-1 uses all of the available processors.
+    Returns the filenames of the thumbnails."""
+    from joblib import Parallel, delayed
+
+    return Parallel(n_jobs=n_jobs)(delayed(render_function)(name, **kwargs)
+                                   for name in names)
@@ -0,0 +1,434 @@
+#!/usr/bin/env python
+"""service.py"""
+import glob
+import json
+import os
+import shutil
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from fringez.fringe import remove_fringe_and_save, load_fringe_model
+from fringez.utils import return_image_cid_qid
+from fringez.instrument import emit, increment
+
+
+def return_model_index(fringe_model_folder):
+    """Returns a dictionary pairing each readout channel, in the syntax
+    c{CID}_q{QID}, with the fringe model for that channel.
+
+    Models are found on disk as
+    fringe_{MODEL_NAME}_comp{N_COMPONENTS}.c{CID}_q{QID}.{DATE}.model
+    If a folder contains more than one model for a readout channel, the first
+    model in alphabetical order is used. """
+
+    model_index = {}
+    model_names = glob.glob(fringe_model_folder + '/fringe*model')
+    model_names.sort()
+    for model_name in model_names:
+        channel = os.path.basename(model_name).split('.')[1]
+        model_index.setdefault(channel, model_name)
+
+    return model_index
+
+
+class FringeModelSet(object):
+    """The fringe models in a single folder. Each model is loaded from disk
+    the first time it is needed and then kept in memory. If max_models is
+    set, the least recently used models are dropped from memory to keep at
+    most max_models loaded at once."""
+
+    def __init__(self, fringe_model_folder, max_models=None):
+        self.fringe_model_folder = fringe_model_folder
+        self.max_models = max_models
+        self.model_index = return_model_index(fringe_model_folder)
+        if len(self.model_index) == 0:
+            raise ValueError('No fringe models found in %s' %
+                             fringe_model_folder)
+
+        self._models = OrderedDict()
+        self._lock = threading.Lock()
+        # One lock per model so that two workers never load the same model
+        # at once, while different models can still be loaded in parallel
+        self._load_locks = {fringe_model_name: threading.Lock()
+                            for fringe_model_name in self.model_index.values()}
+
+    def __len__(self):
+        return len(self._models)
+
+    def return_fringe_model_name(self, image_name):
+        """Returns the fringe model that matches the readout channel
+        of image_name."""
+
+        cid, qid = return_image_cid_qid(os.path.basename(image_name))
+        channel = '%s_%s' % (cid, qid)
+        if channel not in self.model_index:
+            raise KeyError('No fringe model for %s in %s' %
+                           (channel, self.fringe_model_folder))
+
+        return self.model_index[channel]
+
+    def load(self, fringe_model_name):
+        """Returns the fringe model, loading it from disk if it is not
+        already in memory."""
+
+        with self._load_locks[fringe_model_name]:
+            with self._lock:
+                fringe_model = self._models.get(fringe_model_name)
+                if fringe_model is not None:
+                    self._models.move_to_end(fringe_model_name)
+                    return fringe_model
+
+            fringe_model = load_fringe_model(fringe_model_name)
+            increment('models_loaded')
+
+            with self._lock:
+                self._models[fringe_model_name] = fringe_model
+                if self.max_models is not None:
+                    while len(self._models) > self.max_models:
+                        self._models.popitem(last=False)
+
+        return fringe_model
+
+    def preload(self):
+        """Loads every fringe model in the folder into memory."""
+
+        model_names = sorted(self.model_index.values())
+        if self.max_models is not None:
+            model_names = model_names[:self.max_models]
+        for fringe_model_name in model_names:
+            self.load(fringe_model_name)
+
+
+class FringeCleaner(object):
+    """Cleans science images with a set of fringe models that stays loaded
+    in memory between images.
+
+    Images can be cleaned one at a time with clean, or queued with submit to
+    be cleaned by n_workers worker threads. If max_queue is set, submit
+    blocks while max_queue images are already waiting to be cleaned, and
+    try_submit returns None without queueing the image. The
+    fringe models can be replaced with swap_models while images are being
+    cleaned; images already being cleaned finish with the previous models.
+    Clean images are tile compressed if compression_type is set.
+
+    Models are loaded from disk as
+    fringe_{MODEL_NAME}_comp{N_COMPONENTS}.c{CID}_q{QID}.{DATE}.model """
+
+    def __init__(self, fringe_model_folder,
+                 n_workers=1,
+                 max_queue=None,
+                 max_models=None,
+                 preloadFlag=False,
+                 debugFlag=False,
+                 compression_type=None,
+                 quantize_level=16.,
+                 n_latencies=1000):
+        self.n_workers = n_workers
+        self.max_queue = max_queue
+        self.max_models = max_models
+        self.preloadFlag = preloadFlag
+        self.debugFlag = debugFlag
+        self.compression_type = compression_type
+        self.quantize_level = quantize_level
+
+        self.model_set = self._return_model_set(fringe_model_folder)
+
+        self._executor = ThreadPoolExecutor(max_workers=n_workers)
+        if max_queue is None:
+            self._slots = None
+        else:
+            self._slots = threading.BoundedSemaphore(n_workers + max_queue)
+
+        self._lock = threading.Lock()
+        self._n_queued = 0
+        self._n_running = 0
+        self._n_completed = 0
+        self._n_failed = 0
+        self._latencies = deque(maxlen=n_latencies)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+
+    def _return_model_set(self, fringe_model_folder):
+        model_set = FringeModelSet(fringe_model_folder,
+                                   max_models=self.max_models)
+        if self.preloadFlag:
+            print('Loading fringe models from %s' % fringe_model_folder)
+            model_set.preload()
+        return model_set
+
+    @property
+    def fringe_model_folder(self):
+        return self.model_set.fringe_model_folder
+
+    def swap_models(self, fringe_model_folder):
+        """Replaces the fringe models with those in fringe_model_folder.
+        The new models are prepared before the swap, so that cleaning
+        continues with the previous models in the meantime."""
+
+        model_set = self._return_model_set(fringe_model_folder)
+        self.model_set = model_set
+        print('Fringe models swapped to %s' % fringe_model_folder)
+        emit({'event': 'service.swap_models',
+              'fringe_model_folder': fringe_model_folder})
+
+    def clean(self, image_name):
+        """Cleans a single image in the calling thread and returns the
+        filename of the clean image."""
+
+        if not os.path.exists(image_name):
+            raise IOError('Image %s is missing' % image_name)
+
+        # Holding onto the model set means a concurrent swap_models
+        # does not change the models partway through this image
+        model_set = self.model_set
+        fringe_model_name = model_set.return_fringe_model_name(image_name)
+        fringe_model = model_set.load(fringe_model_name)
+
+        return remove_fringe_and_save(image_name=image_name,
+                                      fringe_model_name=fringe_model_name,
+                                      debugFlag=self.debugFlag,
+                                      fringe_model=fringe_model,
+                                      compression_type=self.compression_type,
+                                      quantize_level=self.quantize_level)
+
+    def submit(self, image_name):
+        """Queues an image to be cleaned by the worker threads. Returns a
+        concurrent.futures.Future for the filename of the clean image."""
+
+        if self._slots is not None:
+            self._slots.acquire()
+
+        return self._submit(image_name)
+
+    def try_submit(self, image_name):
+        """Queues an image like submit, but returns None instead of
+        blocking if the queue is full."""
+
+        if self._slots is not None and not self._slots.acquire(blocking=False):
+            return None
+
+        return self._submit(image_name)
+
+    def _submit(self, image_name):
+        with self._lock:
+            self._n_queued += 1
+
+        return self._executor.submit(self._run, image_name,
+                                     time.perf_counter())
+
+    def _run(self, image_name, t_submit):
+        with self._lock:
+            self._n_queued -= 1
+            self._n_running += 1
+
+        successFlag = False
+        try:
+            image_clean_fname = self.clean(image_name)
+            successFlag = True
+        finally:
+            latency = time.perf_counter() - t_submit
+            with self._lock:
+                self._n_running -= 1
+                if successFlag:
+                    self._n_completed += 1
+                else:
+                    self._n_failed += 1
+                self._latencies.append(latency)
+            if self._slots is not None:
+                self._slots.release()
+            emit({'event': 'service.image',
+                  'image_name': image_name,
+                  'success': successFlag,
+                  'latency_seconds': latency})
+
+        return image_clean_fname
+
+    def stats(self):
+        """Returns the queue depth, image counts and latencies, in seconds
+        from submit to completion, of the most recently cleaned images."""
+
+        with self._lock:
+            latencies = np.array(self._latencies)
+            stats = {'fringe_model_folder': self.fringe_model_folder,
+                     'resident_models': len(self.model_set),
+                     'n_workers': self.n_workers,
+                     'max_queue': self.max_queue,
+                     'queue_depth': self._n_queued,
+                     'running': self._n_running,
+                     'completed': self._n_completed,
+                     'failed': self._n_failed}
+
+        if len(latencies) == 0:
+            stats['latency_mean'] = None
+            stats['latency_p50'] = None
+            stats['latency_p95'] = None
+        else:
+            stats['latency_mean'] = float(np.mean(latencies))
+            stats['latency_p50'] = float(np.percentile(latencies, 50))
+            stats['latency_p95'] = float(np.percentile(latencies, 95))
+
+        return stats
+
+    def shutdown(self, wait=True):
+        """Stops the worker threads once all queued images are cleaned."""
+
+        self._executor.shutdown(wait=wait)
+
+
+def _finish_job(spool_folder, working_name, pending, futures, stoppingFlag):
+    """Moves a job file into the done or failed folder once all of its
+    images have been cleaned. If the service is stopping, the images that
+    were never queued are returned to the spool folder as a new job.
+    Returns False if images are still waiting to be queued or cleaned."""
+
+    if pending and not stoppingFlag:
+        return False
+
+    if not all(future.done() for _, future in futures):
+        return False
+
+    job_name = os.path.basename(working_name).replace('.working', '')
+
+    if pending:
+        # Write under another name first, as required of all job files
+        job_fname = os.path.join(spool_folder, job_name)
+        with open(job_fname + '.tmp', 'w') as f:
+            for image_name in pending:
+                f.write('%s\n' % image_name)
+        os.replace(job_fname + '.tmp', job_fname)
+        print('-- %i image(s) from %s returned to %s' % (len(pending),
+                                                         job_name,
+                                                         spool_folder))
+        if not futures:
+            os.remove(working_name)
+            return True
+
+    failures = [(image_name, future.exception())
+                for image_name, future in futures
+                if future.exception() is not None]
+
+    if pending or failures:
+        # Rewrite the finished job with only the images that were queued,
+        # followed by the failures. Appending to the original job file would
+        # join the first failure onto a last line without a newline.
+        with open(working_name, 'w') as f:
+            for image_name, _ in futures:
+                f.write('%s\n' % image_name)
+            for image_name, error in failures:
+                f.write('# FAILED %s : %s\n' % (image_name, error))
+
+    if failures:
+        shutil.move(working_name, os.path.join(spool_folder, 'failed',
+                                               job_name))
+        print('-- %s failed for %i image(s)' % (job_name, len(failures)))
+    else:
+        shutil.move(working_name, os.path.join(spool_folder, 'done',
+                                               job_name))
+        print('-- %s done' % job_name)
+
+    return True
+
+
+def _write_stats(spool_folder, stats):
+    stats_fname = os.path.join(spool_folder, 'stats.json')
+    with open(stats_fname + '.tmp', 'w') as f:
+        json.dump(stats, f, indent=2)
+    os.replace(stats_fname + '.tmp', stats_fname)
+
+
+def serve_spool_folder(cleaner, spool_folder,
+                       poll_interval=1.,
+                       stop_event=None):
+    """Cleans the images requested in the spool folder until stop_event
+    is set.
+
+    Each *.job file in spool_folder lists the images to clean, one per line.
+    Job files should be written under another name and renamed to *.job
+    once complete. Jobs are moved to spool_folder/done once all of their
+    images are clean, or to spool_folder/failed with the errors appended.
+    Writing the path of a new fringe model folder into
+    spool_folder/models.swap, also under another name first, swaps the
+    cleaner to those models.
+    The cleaner's stats are written to spool_folder/stats.json.
+    Once stop_event is set, the images already queued are cleaned and any
+    images not yet queued are returned to spool_folder as a new job.
+    """
+
+    if stop_event is None:
+        stop_event = threading.Event()
+
+    for folder in ['done', 'failed']:
+        if not os.path.exists(os.path.join(spool_folder, folder)):
+            os.makedirs(os.path.join(spool_folder, folder))
+
+    swap_name = os.path.join(spool_folder, 'models.swap')
+    jobs = []
+
+    print('Watching %s for jobs' % spool_folder)
+    while True:
+        stoppingFlag = stop_event.is_set()
+
+        if not stoppingFlag and os.path.exists(swap_name):
+            with open(swap_name) as f:
+                fringe_model_folder = f.read().strip()
+            os.remove(swap_name)
+            try:
+                cleaner.swap_models(fringe_model_folder)
+            except (ValueError, OSError) as e:
+                print('-- Unable to swap fringe models : %s' % e)
+
+        job_names = []
+        if not stoppingFlag:
+            job_names = glob.glob(os.path.join(spool_folder, '*.job'))
+            job_names.sort()
+        for job_name in job_names:
+            working_name = job_name + '.working'
+            try:
+                # Claiming the job by renaming it allows several
+                # services to share a single spool folder
+                os.rename(job_name, working_name)
+            except OSError:
+                continue
+
+            with open(working_name) as f:
+                image_names = [line.strip() for line in f
+                               if line.strip() and not line.startswith('#')]
+            print('Queueing %i image(s) from %s' % (len(image_names),
+                                                    os.path.basename(job_name)))
+            jobs.append((working_name, deque(image_names), []))
+
+        # Queue images without blocking, so that a full queue does not stop
+        # the stats, model swaps and stop requests from being handled
+        pendingFlag = False
+        for working_name, pending, futures in jobs:
+            while pending and not stop_event.is_set():
+                future = cleaner.try_submit(pending[0])
+                if future is None:
+                    break
+                futures.append((pending.popleft(), future))
+            pendingFlag = pendingFlag or bool(pending)
+
+        stoppingFlag = stop_event.is_set()
+        jobs = [(working_name, pending, futures)
+                for working_name, pending, futures in jobs
+                if not _finish_job(spool_folder, working_name, pending,
+                                   futures, stoppingFlag)]
+        _write_stats(spool_folder, cleaner.stats())
+
+        # Check back sooner while images are waiting for room in the queue
+        interval = poll_interval
+        if pendingFlag:
+            interval = min(poll_interval, 0.1)
+
+        if stoppingFlag:
+            if not jobs:
+                break
+            time.sleep(interval)
+        else:
+            stop_event.wait(interval)
@@ -5,15 +5,19 @@ import glob
 import os
 import shutil
 from astropy.io import fits
-import requests
-import wget
-from bs4 import BeautifulSoup
+from fringez.instrument import timed
 
 
 NERSC_url = 'https://portal.nersc.gov/project/ptf/' \
             'iband/ztf_iband_fringe_models_'
 
+# Tile compression algorithms available for writing images. Floating point
+# images are quantized before compression unless quantize_level is 0, which
+# is lossless and only supported by the GZIP algorithms.
+COMPRESSION_TYPES = ['RICE_1', 'GZIP_1', 'GZIP_2', 'HCOMPRESS_1']
 
+
+@timed
 def flatten_images(images):
     """Flattens images for use in 1D analysis"""
 
@@ -32,32 +36,172 @@ def flatten_images(images):
     return images_flattened, image_shape
 
 
+def remove_fz_extension(image_name):
+    """Removes the .fz extension that marks tile compressed images."""
+
+    if image_name.endswith('.fz'):
+        image_name = image_name[:-len('.fz')]
+
+    return image_name
+
+
+def return_fits_name(image_name, extension, compression_type=None):
+    """Returns the filename of an image derived from image_name, with
+    .{EXTENSION}.fits in place of .fits. Following the fpack convention,
+    the filename ends in .fits.fz if the image is tile compressed with
+    compression_type and in .fits if it is uncompressed, regardless of
+    whether image_name is compressed."""
+
+    fname = remove_fz_extension(image_name)
+    fname = fname.replace('.fits', '.%s.fits' % extension)
+    if compression_type is not None:
+        fname += '.fz'
+
+    return fname
+
+
+def return_image_hdu(hdul):
+    """Returns the first HDU in a fits file that contains an image.
+    Tile compressed images are stored in the first extension behind an empty
+    primary HDU, while uncompressed images are stored in the primary HDU.
+    Only the headers are checked, so the data is not read or decompressed."""
+
+    for hdu in hdul:
+        if hdu.is_image and hdu.header.get('NAXIS', 0) > 0:
+            return hdu
+
+    return hdul[0]
+
+
+@timed
+def load_fits(image_name):
+    """Returns the data and header of a fits image, which can be either
+    uncompressed or tile compressed."""
+
+    with fits.open(image_name) as f:
+        hdu = return_image_hdu(f)
+        data = hdu.data
+        header = hdu.header
+
+    return data, header
+
+
+def load_fits_header(image_name):
+    """Returns the header of a fits image, which can be either
+    uncompressed or tile compressed, without reading its data."""
+
+    with fits.open(image_name) as f:
+        header = return_image_hdu(f).header
+
+    return header
+
+
+def return_compression_type(image_name):
+    """Returns the tile compression algorithm of a fits image, read from its
+    ZCMPTYPE keyword, or None if the image is uncompressed."""
+
+    with fits.open(image_name, disable_image_compression=True) as f:
+        for hdu in f:
+            if hdu.header.get('ZIMAGE', False):
+                compression_type = hdu.header['ZCMPTYPE']
+                # RICE_ONE is an older name for RICE_1
+                if compression_type == 'RICE_ONE':
+                    compression_type = 'RICE_1'
+                return compression_type
+
+    return None
+
+
+def validate_compression(compression_type, quantize_level):
+    """Raises a ValueError if images cannot be tile compressed with
+    compression_type at quantize_level. A compression_type of None,
+    which leaves images uncompressed, is always valid."""
+
+    if compression_type is None:
+        return
+
+    if compression_type not in COMPRESSION_TYPES:
+        raise ValueError('compression_type must be one of %s' %
+                         str(COMPRESSION_TYPES))
+    if quantize_level == 0 and not compression_type.startswith('GZIP'):
+        raise ValueError('Lossless compression (quantize_level = 0) '
+                         'requires a GZIP compression_type')
+
+
+def add_compression_arguments(parser):
+    """Adds the --compression-type and --quantize-level arguments
+    to an executable's argument parser."""
+
+    compression = parser.add_argument_group('compression')
+    compression.add_argument('--compression-type', type=str, default=None,
+                             choices=COMPRESSION_TYPES,
+                             help='Tile compress the clean images with this '
+                                  'algorithm. If not set, clean images are '
+                                  'saved uncompressed. Science images can '
+                                  'be read either uncompressed or tile '
+                                  'compressed.')
+    compression.add_argument('--quantize-level', type=float, default=16.,
+                             help='Quantization level used when tile '
+                                  'compressing floating point images. '
+                                  'Larger values preserve more precision. '
+                                  'Set to 0 for lossless compression, '
+                                  'which requires a GZIP --compression-type.')
+
+
+def return_hdulist(data, header=None, compression_type=None,
+                   quantize_level=16.):
+    """Returns an HDUList containing data and the optional header,
+    tile compressed with compression_type unless it is None."""
+
+    if compression_type is None:
+        # Creates the Header Data Unit with the optional 'header'. Passing the
+        # header to the constructor converts the extension header of a tile
+        # compressed image into a valid primary header.
+        hdu = fits.PrimaryHDU(data, header=header)
+
+        return fits.HDUList([hdu])
+
+    validate_compression(compression_type, quantize_level)
+
+    hdu = fits.CompImageHDU(data, header=header,
+                            compression_type=compression_type,
+                            quantize_level=quantize_level)
+
+    return fits.HDUList([fits.PrimaryHDU(), hdu])
+
+
+@timed
 def create_fits(image_name,
                 data,
-                header=None):
+                header=None,
+                compression_type=None,
+                quantize_level=16.):
     """Creates a fits image with an optional header
 
-    Uses the astropy.io.fits pacakge to create a fits image.
+    Uses the astropy.io.fits pacakge to create a fits image. If
+    compression_type is set, the image is tile compressed into the first
+    extension. Floating point images are quantized to quantize_level levels
+    per standard deviation of the background noise before compression.
     WARNING : THIS WILL OVERWRITE ANY FILE ALREADY NAMED 'image_name'.
     """
-    # Creates the Header Data Unit
-    hdu = fits.PrimaryHDU(data)
-
-    # Adds the 'header' if None is not selected
-    if header is not None:
-        hdu.header = header
+    hdul = return_hdulist(data, header,
+                          compression_type=compression_type,
+                          quantize_level=quantize_level)
 
     # Remove the image if it currently exists
     if os.path.exists(image_name):
         os.remove(image_name)
 
     # Write the fits image to disk
-    hdu.writeto(image_name)
+    hdul.writeto(image_name)
 
 
+@timed
 def update_fits(image_name,
                 data=None,
-                header=None):
+                header=None,
+                compression_type=None,
+                quantize_level=16.):
     """Safely replaces a fits image with new data and/or header
 
     Uses the astropy.io.fits pacakge. astropy.io.fits.writeto contains a
@@ -71,26 +215,35 @@ def update_fits(image_name,
         image_name : str
             Name of the image.
         data : numpy.ndarray
-            2-dimensional array of 'float' or 'int'.
+            2-dimensional array of 'float' or 'int'. If None, only the
+            header is updated and the data on disk is left untouched.
         header : astropy.io.fits.header.Header
             Header of the fits image.
+        compression_type : str
+            Tile compression algorithm, one of COMPRESSION_TYPES. If None,
+            the image keeps the compression of the image already on disk,
+            or is written uncompressed if there is none.
+        quantize_level : float
+            Quantization level for tile compressing floating point images.
 
     Returns:
         None
 
     """
 
-    if data is None and header is None:
-        with fits.open(image_name) as f:
-            data = f[0].data
-            header = f[0].header
+    if data is None:
+        update_fits_header(image_name, header)
+        return
+
+    if compression_type is None and os.path.exists(image_name):
+        compression_type = return_compression_type(image_name)
 
     # Write the fits image to a temporary file
-    image_tmp = image_name.replace("fits", "fits.tmp")
-    fits.writeto(image_tmp,
-                 data,
-                 header,
-                 overwrite=True)
+    image_tmp = image_name + '.tmp'
+    hdul = return_hdulist(data, header,
+                          compression_type=compression_type,
+                          quantize_level=quantize_level)
+    hdul.writeto(image_tmp, overwrite=True)
 
     # Remove the original image
     if os.path.exists(image_name):
@@ -100,6 +253,36 @@ def update_fits(image_name,
     shutil.move(image_tmp, image_name)
 
 
+def update_fits_header(image_name, header):
+    """Safely replaces the header of a fits image without rewriting its data
+
+    Rewriting a tile compressed image re-quantizes its floating point pixels,
+    so the header is instead updated in place on a temporary copy of the
+    image, which then replaces the original image. Image compression is
+    disabled while updating so that astropy writes back the compressed table
+    as it is. Structural keywords in header, such as BITPIX and NAXIS, are
+    ignored.
+    """
+
+    if header is None:
+        return
+
+    # Update the header of a temporary copy of the image
+    image_tmp = image_name + '.tmp'
+    shutil.copyfile(image_name, image_tmp)
+    with fits.open(image_tmp, mode='update',
+                   disable_image_compression=True) as f:
+        hdu = f[0]
+        for hdu_compressed in f:
+            if hdu_compressed.header.get('ZIMAGE', False):
+                hdu = hdu_compressed
+                break
+        hdu.header.update(header.copy(strip=True))
+
+    # Rename the temporary image name to the original image name
+    shutil.move(image_tmp, image_name)
+
+
 def generate_random_ds9_list(n_random=6):
     """ Generates a random list of images to be viewed in ds9
     Viewed with: ds9 -zscale $(<ds9.list) """
@@ -140,6 +323,12 @@ def return_fringe_model_name(image, fringe_model_folder):
     return fringe_model
 
 def download_models(model_date, fringe_model_dir, model_id=None):
+    # Only fringez-download needs these packages, so they are imported here
+    # to keep the other executables fast to start
+    import requests
+    import wget
+    from bs4 import BeautifulSoup
+
     source_code = requests.get(NERSC_url + model_date)
     plain_text = source_code.text
     soup = BeautifulSoup(plain_text, "html.parser")
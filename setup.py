@@ -46,7 +46,9 @@ setup(name=DISTNAME,
                         'beautifulsoup4'],
       scripts=['bin/fringez-generate',
                'bin/fringez-clean',
-               'bin/fringez-download'],
+               'bin/fringez-download',
+               'bin/fringez-serve',
+               'bin/fringez-qa'],
       classifiers=['Intended Audience :: Science/Research',
                    'Programming Language :: Python :: 3.5',
                    'License :: OSI Approved :: MIT License',
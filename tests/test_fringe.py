@@ -0,0 +1,71 @@
+#! /usr/bin/env python
+"""
+test_fringe.py
+"""
+import os
+import shutil
+import numpy as np
+import pytest
+from astropy.io import fits
+from fringez.fringe import remove_fringe_and_save
+from fringez.utils import load_fits, return_compression_type
+
+IMAGE_NAME = 'ztf_20190703184838_000481_zi_c02_o_q1_sciimg.fits'
+MODEL_NAME = 'fringe_PCArandom_comp02.c02_q1.20200101.model'
+
+
+def write_fringe_model(model_name, seed=0):
+    rng = np.random.RandomState(seed)
+    np.savez(model_name,
+             mean=np.zeros((1, 64 * 64)),
+             components=rng.normal(size=(2, 64 * 64)),
+             explained_variance=np.ones(2))
+    shutil.move(model_name + '.npz', model_name)
+    return model_name
+
+
+@pytest.fixture
+def fringe_model_name(tmp_path):
+    return write_fringe_model(str(tmp_path / MODEL_NAME))
+
+
+def write_image(image_name, compressFlag):
+    rng = np.random.RandomState(1)
+    data = rng.normal(150, 10, (64, 64)).astype(np.float32)
+    header = fits.Header()
+    header['MAGLIM'] = 20.5
+    if compressFlag:
+        hdu = fits.CompImageHDU(data, header=header, compression_type='RICE_1')
+        fits.HDUList([fits.PrimaryHDU(), hdu]).writeto(image_name)
+    else:
+        fits.writeto(image_name, data, header)
+
+
+@pytest.mark.parametrize('compressFlag', [False, True])
+@pytest.mark.parametrize('compression_type', [None, 'RICE_1'])
+def test_remove_fringe_and_save(tmp_path, fringe_model_name,
+                                compressFlag, compression_type):
+    image_name = str(tmp_path / IMAGE_NAME)
+    if compressFlag:
+        image_name += '.fz'
+    write_image(image_name, compressFlag)
+
+    image_clean_fname = remove_fringe_and_save(image_name,
+                                               fringe_model_name,
+                                               debugFlag=True,
+                                               compression_type=compression_type)
+
+    expected_fname = str(tmp_path / IMAGE_NAME).replace('.fits',
+                                                        '.clean.fits')
+    bias_fname = str(tmp_path / IMAGE_NAME).replace(
+        '.fits', '.%s.fits' % MODEL_NAME.replace('.model', '.bias'))
+    if compression_type is not None:
+        expected_fname += '.fz'
+        bias_fname += '.fz'
+    assert image_clean_fname == expected_fname
+    assert os.path.exists(bias_fname)
+    assert return_compression_type(image_clean_fname) == compression_type
+
+    data, header = load_fits(image_clean_fname)
+    assert data.shape == (64, 64)
+    assert header['FRNGMDL'] == MODEL_NAME
@@ -0,0 +1,69 @@
+#! /usr/bin/env python
+"""
+test_instrument.py
+"""
+import json
+import os
+import pytest
+from fringez import instrument
+from fringez.instrument import (enable_instrumentation,
+                                disable_instrumentation,
+                                increment, timed, timer)
+
+
+@timed
+def add(a, b):
+    return a + b
+
+
+@pytest.fixture(autouse=True)
+def instrumentation_off():
+    yield
+    disable_instrumentation()
+
+
+def read_records(metrics_out):
+    with open(metrics_out) as f:
+        return [json.loads(line) for line in f]
+
+
+def test_disabled_writes_nothing(tmp_path):
+    metrics_out = str(tmp_path / 'metrics.jsonl')
+    instrument._state['metrics_out'] = metrics_out
+
+    assert add(1, 2) == 3
+    increment('images_cleaned')
+    with timer('fringe.read_headers'):
+        pass
+    disable_instrumentation()
+
+    assert not os.path.exists(metrics_out)
+
+
+def test_metrics_out(tmp_path):
+    metrics_out = str(tmp_path / 'metrics.jsonl')
+    enable_instrumentation(metrics_out=metrics_out)
+
+    assert add(1, 2) == 3
+    assert add(3, 4) == 7
+    increment('images_cleaned')
+    increment('images_cleaned', 2)
+    disable_instrumentation()
+
+    records = read_records(metrics_out)
+    assert [record['event'] for record in records] == ['timer', 'timer',
+                                                       'summary']
+    for record in records[:2]:
+        assert record['name'] == 'test_instrument.add'
+        assert record['seconds'] >= 0
+        assert record['pid'] == os.getpid()
+
+    summary = records[-1]
+    assert summary['timers']['test_instrument.add']['count'] == 2
+    assert summary['counters'] == {'images_cleaned': 3}
+
+    # Nothing is written once instrumentation is disabled again
+    add(5, 6)
+    increment('images_cleaned')
+    disable_instrumentation()
+    assert len(read_records(metrics_out)) == 3
@@ -0,0 +1,97 @@
+#! /usr/bin/env python
+"""
+test_plot.py
+"""
+import os
+import numpy as np
+import pytest
+import matplotlib.image
+from fringez.plot import (decimate_image, return_histogram_sample,
+                          save_thumbnail, render_before_and_after_thumbnail,
+                          render_components_thumbnail)
+from fringez.utils import create_fits, return_fits_name
+from test_fringe import IMAGE_NAME, write_image, fringe_model_name
+
+
+def test_decimate_image():
+    image = np.arange(16, dtype=float).reshape(4, 4)
+
+    decimated = decimate_image(image, max_size=2)
+
+    assert decimated.shape == (2, 2)
+    assert np.array_equal(decimated, [[2.5, 4.5], [10.5, 12.5]])
+    assert decimate_image(image, max_size=4) is image
+
+
+def test_decimate_image_uneven():
+    image = np.arange(70, dtype=float).reshape(10, 7)
+
+    # A factor of 4 keeps the 8x4 pixels that fill whole blocks
+    decimated = decimate_image(image, max_size=3)
+
+    assert decimated.shape == (2, 1)
+    assert decimated[0, 0] == image[:4, :4].mean()
+    assert decimated[1, 0] == image[4:8, :4].mean()
+
+
+def test_return_histogram_sample():
+    image = np.arange(100000).reshape(100, 1000)
+
+    sample = return_histogram_sample(image, n_samples=1000)
+
+    assert len(sample) == 1000
+    assert np.array_equal(sample[:2], [0, 100])
+    assert len(return_histogram_sample(image[:1, :10], n_samples=1000)) == 10
+
+
+def test_save_thumbnail(tmp_path):
+    vmax = 1.
+    panels = [np.full((4, 5), vmax),
+              np.zeros((4, 5)),
+              np.full((4, 5), vmax)]
+    fname = str(tmp_path / 'thumbnail.png')
+
+    assert save_thumbnail(fname, panels, vmax, n_col=2, gap=4) == fname
+
+    # Two rows and two columns of panels separated by gaps of 4 pixels
+    thumbnail = matplotlib.image.imread(fname)[:, :, 0]
+    assert thumbnail.shape == (2 * 4 + 4, 2 * 5 + 4)
+    # The first panel is drawn in the top left and the gaps are black
+    assert np.all(thumbnail[:4, :5] == 1)
+    assert np.allclose(thumbnail[:4, 9:], 0.5, atol=0.01)
+    assert np.all(thumbnail[8:, :5] == 1)
+    assert np.all(thumbnail[4:8] == 0)
+    assert np.all(thumbnail[8:, 9:] == 0)
+
+
+@pytest.mark.parametrize('compressFlag', [False, True])
+@pytest.mark.parametrize('compression_type', [None, 'RICE_1'])
+def test_render_before_and_after_thumbnail(tmp_path, compressFlag,
+                                           compression_type):
+    image_name = str(tmp_path / IMAGE_NAME)
+    if compressFlag:
+        image_name += '.fz'
+    write_image(image_name, compressFlag)
+    image_clean_name = return_fits_name(image_name, 'clean',
+                                        compression_type=compression_type)
+    create_fits(image_clean_name, np.zeros((64, 64), dtype=np.float32),
+                compression_type=compression_type)
+
+    fname = render_before_and_after_thumbnail(image_clean_name, max_size=32)
+
+    assert fname == str(tmp_path / IMAGE_NAME).replace('.fits',
+                                                       '.clean.qa.png')
+    assert matplotlib.image.imread(fname).shape[:2] == (32, 3 * 32 + 2 * 4)
+
+
+def test_render_components_thumbnail(fringe_model_name):
+    fname = render_components_thumbnail(fringe_model_name, (64, 64),
+                                        max_size=16)
+
+    assert fname == fringe_model_name + '.qa.png'
+    assert os.path.exists(fname)
+    # Two components tiled into a grid two panels wide
+    assert matplotlib.image.imread(fname).shape[:2] == (16, 2 * 16 + 4)
+
+    with pytest.raises(ValueError):
+        render_components_thumbnail(fringe_model_name, (32, 32))
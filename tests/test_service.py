@@ -0,0 +1,237 @@
+#! /usr/bin/env python
+"""
+test_service.py
+"""
+import os
+import threading
+import time
+from contextlib import contextmanager
+import pytest
+from fringez import service
+from fringez.service import FringeCleaner, FringeModelSet, serve_spool_folder
+from fringez.utils import load_fits
+from test_fringe import (IMAGE_NAME, MODEL_NAME, write_image,
+                         write_fringe_model, fringe_model_name)
+
+
+def return_image_name(folder, i):
+    return str(folder / IMAGE_NAME.replace('184838', '1848%02i' % i))
+
+
+def wait_for(condition, timeout=10.):
+    t0 = time.time()
+    while not condition():
+        if time.time() - t0 > timeout:
+            raise AssertionError('Timed out waiting for condition')
+        time.sleep(0.01)
+
+
+class GatedCleaner(FringeCleaner):
+    """Waits for gate to be set before cleaning each image."""
+
+    def __init__(self, *args, **kwargs):
+        self.gate = threading.Event()
+        super(GatedCleaner, self).__init__(*args, **kwargs)
+
+    def clean(self, image_name):
+        self.gate.wait(10)
+        return super(GatedCleaner, self).clean(image_name)
+
+
+@pytest.fixture
+def spool_folder(tmp_path):
+    spool_folder = tmp_path / 'spool'
+    spool_folder.mkdir()
+    return spool_folder
+
+
+@contextmanager
+def running_service(cleaner, spool_folder):
+    """Serves spool_folder in another thread, which is always stopped
+    on exit so that a failed test does not leave it running."""
+
+    stop_event = threading.Event()
+    thread = threading.Thread(target=serve_spool_folder,
+                              args=(cleaner, str(spool_folder)),
+                              kwargs={'poll_interval': 0.05,
+                                      'stop_event': stop_event})
+    thread.start()
+    try:
+        yield stop_event, thread
+    finally:
+        stop_event.set()
+        if hasattr(cleaner, 'gate'):
+            cleaner.gate.set()
+        thread.join(10)
+
+
+def write_spool_file(spool_folder, fname, text):
+    # Written under another name first, as the service requires
+    spool_fname = str(spool_folder / fname)
+    with open(spool_fname + '.tmp', 'w') as f:
+        f.write(text)
+    os.rename(spool_fname + '.tmp', spool_fname)
+
+
+def write_job(spool_folder, job_name, image_names):
+    # Written without a trailing newline
+    write_spool_file(spool_folder, job_name, '\n'.join(image_names))
+
+
+def test_model_set_lru(tmp_path):
+    model_names = [write_fringe_model(str(tmp_path / MODEL_NAME.replace(
+        'q1', 'q%i' % qid)), seed=qid) for qid in [1, 2, 3]]
+    model_set = FringeModelSet(str(tmp_path), max_models=2)
+
+    for model_name in model_names:
+        model_set.load(model_name)
+    model_set.load(model_names[1])
+    model_set.load(model_names[0])
+
+    assert len(model_set) == 2
+    assert list(model_set._models) == [model_names[1], model_names[0]]
+
+
+def test_model_set_loads_once(tmp_path, fringe_model_name, monkeypatch):
+    loads = []
+
+    def load_fringe_model(model_name):
+        loads.append(model_name)
+        time.sleep(0.1)
+        return {}
+
+    monkeypatch.setattr(service, 'load_fringe_model', load_fringe_model)
+    model_set = FringeModelSet(str(tmp_path))
+    threads = [threading.Thread(target=model_set.load,
+                                args=(fringe_model_name,))
+               for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert loads == [fringe_model_name]
+
+
+def test_submit_and_stats(tmp_path, fringe_model_name):
+    image_names = [return_image_name(tmp_path, i) for i in range(3)]
+    for image_name in image_names:
+        write_image(image_name, compressFlag=False)
+
+    with FringeCleaner(str(tmp_path), n_workers=2) as cleaner:
+        futures = [cleaner.submit(image_name) for image_name in image_names]
+        image_clean_fnames = [future.result() for future in futures]
+
+    for image_name, image_clean_fname in zip(image_names, image_clean_fnames):
+        assert image_clean_fname == image_name.replace('.fits', '.clean.fits')
+        assert os.path.exists(image_clean_fname)
+
+    stats = cleaner.stats()
+    assert stats['completed'] == 3
+    assert stats['failed'] == 0
+    assert stats['queue_depth'] == 0
+    assert stats['running'] == 0
+    assert stats['resident_models'] == 1
+    assert stats['latency_p95'] > 0
+
+
+def test_try_submit_max_queue(tmp_path, fringe_model_name):
+    image_names = [return_image_name(tmp_path, i) for i in range(3)]
+    for image_name in image_names:
+        write_image(image_name, compressFlag=False)
+
+    with GatedCleaner(str(tmp_path), n_workers=1, max_queue=1) as cleaner:
+        futures = [cleaner.try_submit(image_names[0]),
+                   cleaner.try_submit(image_names[1])]
+        assert cleaner.try_submit(image_names[2]) is None
+        assert cleaner.stats()['queue_depth'] + \
+            cleaner.stats()['running'] == 2
+
+        cleaner.gate.set()
+        futures[0].result()
+        futures.append(cleaner.try_submit(image_names[2]))
+        assert futures[-1] is not None
+        for future in futures:
+            future.result()
+
+    assert cleaner.stats()['completed'] == 3
+
+
+def test_swap_models(tmp_path, fringe_model_name):
+    swap_folder = tmp_path / 'swap'
+    swap_folder.mkdir()
+    swap_model_name = MODEL_NAME.replace('20200101', '20200202')
+    write_fringe_model(str(swap_folder / swap_model_name), seed=1)
+    image_names = [return_image_name(tmp_path, i) for i in range(2)]
+    for image_name in image_names:
+        write_image(image_name, compressFlag=False)
+
+    with FringeCleaner(str(tmp_path)) as cleaner:
+        image_clean_fname = cleaner.submit(image_names[0]).result()
+        assert load_fits(image_clean_fname)[1]['FRNGMDL'] == MODEL_NAME
+
+        cleaner.swap_models(str(swap_folder))
+        assert cleaner.stats()['fringe_model_folder'] == str(swap_folder)
+        image_clean_fname = cleaner.submit(image_names[1]).result()
+        assert load_fits(image_clean_fname)[1]['FRNGMDL'] == swap_model_name
+
+
+def test_spool_done_and_failed(tmp_path, fringe_model_name, spool_folder):
+    image_names = [return_image_name(tmp_path, i) for i in range(2)]
+    for image_name in image_names:
+        write_image(image_name, compressFlag=False)
+    missing_name = return_image_name(tmp_path, 2)
+
+    with FringeCleaner(str(tmp_path)) as cleaner:
+        with running_service(cleaner, spool_folder) as (_, thread):
+            write_job(spool_folder, 'a.job', image_names)
+            write_job(spool_folder, 'b.job', [image_names[0], missing_name])
+            wait_for(lambda: os.path.exists(str(spool_folder / 'done/a.job'))
+                     and os.path.exists(str(spool_folder / 'failed/b.job')))
+
+    assert not thread.is_alive()
+    with open(str(spool_folder / 'failed/b.job')) as f:
+        lines = f.read().splitlines()
+    assert lines[:2] == [image_names[0], missing_name]
+    assert lines[2].startswith('# FAILED %s : ' % missing_name)
+    assert 'is missing' in lines[2]
+    assert len(lines) == 3
+
+    stats = cleaner.stats()
+    assert stats['completed'] == 3
+    assert stats['failed'] == 1
+    assert os.path.exists(str(spool_folder / 'stats.json'))
+
+
+def test_spool_swap_models(tmp_path, fringe_model_name, spool_folder):
+    swap_folder = tmp_path / 'swap'
+    swap_folder.mkdir()
+    write_fringe_model(str(swap_folder / MODEL_NAME), seed=1)
+
+    with FringeCleaner(str(tmp_path)) as cleaner:
+        with running_service(cleaner, spool_folder):
+            write_spool_file(spool_folder, 'models.swap', '%s\n' % swap_folder)
+            wait_for(lambda: cleaner.fringe_model_folder == str(swap_folder))
+
+    assert not os.path.exists(str(spool_folder / 'models.swap'))
+
+
+def test_spool_stop_returns_pending(tmp_path, fringe_model_name,
+                                    spool_folder):
+    image_names = [return_image_name(tmp_path, i) for i in range(3)]
+    for image_name in image_names:
+        write_image(image_name, compressFlag=False)
+
+    with GatedCleaner(str(tmp_path), n_workers=1, max_queue=0) as cleaner:
+        with running_service(cleaner, spool_folder) as (stop_event, thread):
+            write_job(spool_folder, 'a.job', image_names)
+            wait_for(lambda: cleaner.stats()['running'] == 1)
+            stop_event.set()
+            cleaner.gate.set()
+
+    assert not thread.is_alive()
+    with open(str(spool_folder / 'a.job')) as f:
+        assert f.read().splitlines() == image_names[1:]
+    with open(str(spool_folder / 'done/a.job')) as f:
+        assert f.read().splitlines() == image_names[:1]
+    assert not os.path.exists(str(spool_folder / 'a.job.working'))
@@ -0,0 +1,119 @@
+#! /usr/bin/env python
+"""
+test_utils.py
+"""
+import os
+import numpy as np
+import pytest
+from astropy.io import fits
+from fringez.utils import (create_fits, load_fits, update_fits,
+                           return_compression_type, return_fits_name,
+                           validate_compression)
+
+
+def write_compressed_image(image_name, compression_type='RICE_1'):
+    rng = np.random.RandomState(0)
+    data = rng.normal(150, 10, (64, 64)).astype(np.float32)
+    header = fits.Header()
+    header['MAGLIM'] = 20.5
+    hdu = fits.CompImageHDU(data, header=header,
+                            compression_type=compression_type)
+    fits.HDUList([fits.PrimaryHDU(), hdu]).writeto(image_name)
+    return data
+
+
+def test_load_fits_compressed(tmp_path):
+    image_name = str(tmp_path / 'ztf_sciimg.fits.fz')
+    data = write_compressed_image(image_name, compression_type='GZIP_2')
+
+    data_loaded, header = load_fits(image_name)
+
+    assert data_loaded.shape == data.shape
+    assert header['MAGLIM'] == 20.5
+
+
+@pytest.mark.parametrize('compression_type', [None, 'RICE_1', 'GZIP_2'])
+def test_create_fits_from_compressed_input(tmp_path, compression_type):
+    image_name = str(tmp_path / 'ztf_sciimg.fits.fz')
+    write_compressed_image(image_name)
+    data, header = load_fits(image_name)
+
+    out_name = str(tmp_path / 'ztf_sciimg.clean.fits')
+    create_fits(out_name, data, header,
+                compression_type=compression_type,
+                quantize_level=0 if compression_type == 'GZIP_2' else 16.)
+
+    with fits.open(out_name) as f:
+        f.verify('exception')
+        if compression_type is None:
+            assert len(f) == 1
+        else:
+            assert isinstance(f[1], fits.CompImageHDU)
+
+    data_out, header_out = load_fits(out_name)
+    assert header_out['MAGLIM'] == 20.5
+    if compression_type == 'RICE_1':
+        assert np.allclose(data_out, data, atol=1.)
+    else:
+        assert np.array_equal(data_out, data)
+
+
+@pytest.mark.parametrize('compression_type', [None, 'GZIP_2'])
+def test_update_fits_keeps_compression(tmp_path, compression_type):
+    if compression_type is None:
+        image_name = str(tmp_path / 'ztf_sciimg.fits')
+        create_fits(image_name, np.ones((64, 64), dtype=np.float32))
+    else:
+        image_name = str(tmp_path / 'ztf_sciimg.fits.fz')
+        write_compressed_image(image_name, compression_type=compression_type)
+    data, header = load_fits(image_name)
+    header['UBI2'] = 1.5
+
+    update_fits(image_name, data, header)
+
+    assert return_compression_type(image_name) == compression_type
+    assert load_fits(image_name)[1]['UBI2'] == 1.5
+    assert not os.path.exists(image_name + '.tmp')
+
+
+@pytest.mark.parametrize('image_name, compression_type, fname', [
+    ('ztf_sciimg.fits', None, 'ztf_sciimg.clean.fits'),
+    ('ztf_sciimg.fits', 'RICE_1', 'ztf_sciimg.clean.fits.fz'),
+    ('ztf_sciimg.fits.fz', None, 'ztf_sciimg.clean.fits'),
+    ('ztf_sciimg.fits.fz', 'RICE_1', 'ztf_sciimg.clean.fits.fz'),
+])
+def test_return_fits_name(image_name, compression_type, fname):
+    assert return_fits_name(image_name, 'clean',
+                            compression_type=compression_type) == fname
+
+
+def test_update_fits_header_keeps_compressed_pixels(tmp_path):
+    image_name = str(tmp_path / 'ztf_sciimg.fits.fz')
+    write_compressed_image(image_name, compression_type='RICE_1')
+    data, header = load_fits(image_name)
+
+    for i in range(3):
+        header['UBI2'] = float(i)
+        update_fits(image_name, header=header)
+
+    data_out, header_out = load_fits(image_name)
+    assert np.array_equal(data_out, data)
+    assert header_out['UBI2'] == 2.
+    assert header_out['MAGLIM'] == 20.5
+    assert return_compression_type(image_name) == 'RICE_1'
+    assert not os.path.exists(image_name + '.tmp')
+
+
+@pytest.mark.parametrize('compression_type, quantize_level, validFlag', [
+    (None, 0, True),
+    ('RICE_1', 16., True),
+    ('GZIP_2', 0, True),
+    ('RICE_1', 0, False),
+    ('BZIP_1', 16., False),
+])
+def test_validate_compression(compression_type, quantize_level, validFlag):
+    if validFlag:
+        validate_compression(compression_type, quantize_level)
+    else:
+        with pytest.raises(ValueError):
+            validate_compression(compression_type, quantize_level)